@@ -1,10 +1,12 @@
 import socket
 import time
 import random
+import math
 from datetime import datetime
 
 # ===== DB integration helpers =====
 import os
+import csv
 import json
 import uuid
 from pathlib import Path
@@ -596,6 +598,427 @@ def simulate_continuous_sending(interval=30):
     except KeyboardInterrupt:
         print("\nSimulator stopped by user")
 
+# ===== Soak test helpers =====
+SOAK_TABLES = ["HL7Message", "Result", "AutomateTransferLog"]
+SOAK_COLUMNS = [
+    "timestamp", "elapsed_s", "sent_total", "acked_total", "errors_total", "reconnects",
+    "throughput_msg_s", "error_count", "latency_p50_ms", "latency_p95_ms", "latency_max_ms",
+    "listener_pid", "listener_restarts", "rss_mb", "open_fds", "cpu_pct",
+] + [f"{table}_{suffix}" for table in SOAK_TABLES for suffix in ("rows", "mb")]
+
+
+def _find_pid_listening_on(port):
+    """Return the PID of the local process listening on the given TCP port, using /proc"""
+    inodes = set()
+    for proc_file in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            lines = Path(proc_file).read_text().splitlines()[1:]
+        except Exception:
+            continue
+        for line in lines:
+            parts = line.split()
+            # parts[1] is "ADDR:PORT" in hex, parts[3] is the state (0A = LISTEN)
+            if len(parts) > 9 and parts[3] == "0A" and int(parts[1].split(":")[1], 16) == port:
+                inodes.add(f"socket:[{parts[9]}]")
+    if not inodes:
+        return None
+    for pid_dir in Path("/proc").iterdir():
+        if not pid_dir.name.isdigit():
+            continue
+        try:
+            for fd in (pid_dir / "fd").iterdir():
+                if os.readlink(fd) in inodes:
+                    return int(pid_dir.name)
+        except Exception:
+            continue
+    return None
+
+
+class ProcSampler:
+    """Samples RSS, open file descriptors and CPU usage of a process from /proc.
+    If the process goes away, the listener on `port` is looked up again and counted as a restart"""
+
+    def __init__(self, pid, port=None):
+        self.pid = pid
+        self.port = port
+        self.restarts = 0
+        self.clk_tck = os.sysconf("SC_CLK_TCK")
+        self._last_cpu_ticks = None
+        self._last_wall = None
+
+    def _refresh_pid(self):
+        if self.pid and Path(f"/proc/{self.pid}").exists():
+            return
+        if self.pid:
+            print(f"[SOAK] Listener process PID {self.pid} is gone")
+        new_pid = _find_pid_listening_on(self.port) if self.port else None
+        if new_pid and new_pid != self.pid:
+            if self.pid:
+                self.restarts += 1
+            print(f"[SOAK] Now sampling listener process PID {new_pid}")
+        elif self.pid:
+            # Count the disappearance once, even if nothing is listening yet
+            self.restarts += 1
+        self.pid = new_pid
+        # CPU deltas must not span two different processes
+        self._last_cpu_ticks = None
+        self._last_wall = None
+
+    def _cpu_ticks(self):
+        stat = Path(f"/proc/{self.pid}/stat").read_text()
+        # The process name may contain spaces, so split after the closing paren
+        fields = stat[stat.rfind(")") + 2:].split()
+        return int(fields[11]) + int(fields[12])  # utime + stime
+
+    def sample(self):
+        self._refresh_pid()
+        if not self.pid:
+            return {"listener_restarts": self.restarts}
+        try:
+            rss_kb = None
+            for line in Path(f"/proc/{self.pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    rss_kb = int(line.split()[1])
+                    break
+            fds = len(os.listdir(f"/proc/{self.pid}/fd"))
+            ticks = self._cpu_ticks()
+            wall = time.time()
+            cpu_pct = None
+            if self._last_cpu_ticks is not None and wall > self._last_wall:
+                cpu_pct = round(100.0 * (ticks - self._last_cpu_ticks) / self.clk_tck / (wall - self._last_wall), 2)
+            self._last_cpu_ticks, self._last_wall = ticks, wall
+            return {
+                "listener_pid": self.pid,
+                "listener_restarts": self.restarts,
+                "rss_mb": round(rss_kb / 1024.0, 2) if rss_kb is not None else None,
+                "open_fds": fds,
+                "cpu_pct": cpu_pct,
+            }
+        except Exception as e:
+            print(f"[SOAK] Could not sample /proc/{self.pid}: {e}")
+            return {"listener_pid": self.pid, "listener_restarts": self.restarts}
+
+
+def _db_table_stats():
+    """Row counts and on-disk size for the tables the listener writes to"""
+    stats = {}
+    if not _DB.available:
+        return stats
+    try:
+        with _DB.conn.cursor() as cur:
+            for table in SOAK_TABLES:
+                cur.execute(f'SELECT COUNT(*), pg_total_relation_size(\'"{table}"\') FROM "{table}"')
+                rows, size = cur.fetchone()
+                stats[f"{table}_rows"] = rows
+                stats[f"{table}_mb"] = round(size / (1024.0 * 1024.0), 3)
+    except Exception as e:
+        print(f"[SOAK] Could not sample table stats: {e}")
+    return stats
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _linear_trend(xs, ys):
+    """Least-squares slope and r^2 of ys over xs (ignores missing values)"""
+    pairs = [(x, y) for x, y in zip(xs, ys) if y is not None]
+    n = len(pairs)
+    if n < 3:
+        return None, None
+    mean_x = sum(x for x, _ in pairs) / n
+    mean_y = sum(y for _, y in pairs) / n
+    sxx = sum((x - mean_x) ** 2 for x, _ in pairs)
+    syy = sum((y - mean_y) ** 2 for _, y in pairs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in pairs)
+    if sxx == 0:
+        return None, None
+    slope = sxy / sxx
+    r2 = (sxy * sxy) / (sxx * syy) if syy else 0.0
+    return slope, r2
+
+
+def _window_mean(samples, key):
+    values = [s[key] for s in samples if s.get(key) is not None]
+    return sum(values) / len(values) if values else None
+
+
+def _send_soak_message(sock, hl7, seq):
+    """Send one ORU^R01 on an open socket and wait for the full MLLP-framed ACK"""
+    message = hl7.create_result_message(patient_id=f"SOAK{seq:08d}", request_id=f"SOAKREQ{seq:08d}")
+    sock.sendall(b'\x0b' + message.encode('utf-8') + b'\x1c\x0d')
+    ack = b''
+    while not ack.endswith(b'\x1c\x0d'):
+        chunk = sock.recv(1024)
+        if not chunk:
+            raise ConnectionError("Connection closed before ACK")
+        ack += chunk
+    if b'MSA|AA' not in ack:
+        raise RuntimeError("NACK received")
+
+
+def analyze_soak_samples(samples, warmup_s=300, min_trend_span_s=600, rss_leak_mb=20.0,
+                         rss_leak_mb_per_hour=10.0, fd_leak_count=20, throughput_drop_pct=10.0,
+                         latency_rise_pct=25.0, cpu_rise_pct=50.0):
+    """Derive growth rates and leak/drift flags from soak samples"""
+    summary = {"samples": len(samples), "flags": [], "notes": []}
+    steady = [s for s in samples if s["elapsed_s"] >= warmup_s]
+    summary["steady_samples"] = len(steady)
+    steady_span = steady[-1]["elapsed_s"] - steady[0]["elapsed_s"] if steady else 0
+    if len(steady) < 3:
+        summary["notes"].append(f"Run shorter than warm-up ({warmup_s}s); no trend analysis")
+        steady = []
+    elif steady_span < min_trend_span_s:
+        summary["notes"].append(f"Steady-state span {steady_span:.0f}s is under {min_trend_span_s}s; no trend analysis")
+        steady = []
+
+    # Process metrics are only comparable within one listener process, so fit the last PID segment
+    last_pid = steady[-1].get("listener_pid") if steady else None
+    proc = [s for s in steady if s.get("listener_pid") == last_pid]
+    proc_span = proc[-1]["elapsed_s"] - proc[0]["elapsed_s"] if proc else 0
+    if steady and (len(proc) < 3 or proc_span < min_trend_span_s):
+        summary["notes"].append(f"Listener PID {last_pid} sampled for only {proc_span:.0f}s; no process trend analysis")
+        proc = []
+    elif len(proc) < len(steady):
+        summary["notes"].append(f"Process trends fitted on listener PID {last_pid} only ({len(proc)} samples)")
+
+    if proc:
+        hours = [s["elapsed_s"] / 3600.0 for s in proc]
+        window = max(1, len(proc) // 5)
+        head, tail = proc[:window], proc[-window:]
+
+        slope, r2 = _linear_trend(hours, [s.get("rss_mb") for s in proc])
+        summary["rss_mb_per_hour"] = round(slope, 3) if slope is not None else None
+        summary["rss_trend_r2"] = round(r2, 3) if r2 is not None else None
+        rss_start, rss_end = _window_mean(head, "rss_mb"), _window_mean(tail, "rss_mb")
+        if (slope is not None and slope > rss_leak_mb_per_hour and r2 >= 0.6
+                and rss_start is not None and rss_end is not None and rss_end - rss_start > rss_leak_mb):
+            summary["flags"].append(f"RSS leak suspected: {rss_start:.1f} -> {rss_end:.1f} MB, "
+                                    f"+{slope:.1f} MB/h (r2={r2:.2f})")
+
+        slope, r2 = _linear_trend(hours, [s.get("open_fds") for s in proc])
+        summary["fds_per_hour"] = round(slope, 3) if slope is not None else None
+        fd_start, fd_end = _window_mean(head, "open_fds"), _window_mean(tail, "open_fds")
+        if fd_start is not None and fd_end is not None and fd_end - fd_start > fd_leak_count and r2 and r2 >= 0.6:
+            summary["flags"].append(f"File descriptor leak suspected: {fd_start:.0f} -> {fd_end:.0f} open fds")
+
+    if steady:
+        window = max(1, len(steady) // 5)
+        for key, label, series in (("throughput_msg_s", "Throughput", steady), ("latency_p95_ms", "p95 latency", steady),
+                                   ("latency_p50_ms", "p50 latency", steady), ("cpu_pct", "CPU", proc)):
+            if not series:
+                continue
+            head, tail = series[:window], series[-window:]
+            start, end = _window_mean(head, key), _window_mean(tail, key)
+            summary[f"{key}_start"] = round(start, 3) if start is not None else None
+            summary[f"{key}_end"] = round(end, 3) if end is not None else None
+            if not start or end is None:
+                continue
+            change_pct = 100.0 * (end - start) / start
+            summary[f"{key}_change_pct"] = round(change_pct, 1)
+            if key == "throughput_msg_s" and change_pct < -throughput_drop_pct:
+                summary["flags"].append(f"{label} drift: {start:.2f} -> {end:.2f} msg/s ({change_pct:.1f}%)")
+            elif key.startswith("latency") and change_pct > latency_rise_pct:
+                summary["flags"].append(f"{label} drift: {start:.1f} -> {end:.1f} ms (+{change_pct:.1f}%)")
+            elif key == "cpu_pct" and change_pct > cpu_rise_pct:
+                summary["flags"].append(f"{label} drift at constant load: {start:.1f}% -> {end:.1f}%")
+
+    first, last = samples[0], samples[-1]
+    span_h = (last["elapsed_s"] - first["elapsed_s"]) / 3600.0
+    for table in SOAK_TABLES:
+        if f"{table}_rows" not in first or f"{table}_rows" not in last:
+            continue
+        row_delta = last[f"{table}_rows"] - first[f"{table}_rows"]
+        mb_delta = last[f"{table}_mb"] - first[f"{table}_mb"]
+        summary[f"{table}_rows_added"] = row_delta
+        summary[f"{table}_mb_added"] = round(mb_delta, 3)
+        if span_h > 0:
+            summary[f"{table}_rows_per_hour"] = round(row_delta / span_h, 1)
+            summary[f"{table}_mb_per_hour"] = round(mb_delta / span_h, 3)
+    restarts = last.get("listener_restarts") or 0
+    summary["listener_restarts"] = restarts
+    summary["listener_pids"] = list(dict.fromkeys(s["listener_pid"] for s in samples if s.get("listener_pid")))
+    if restarts:
+        summary["flags"].append(f"Listener process disappeared {restarts} time(s) during the run")
+
+    acked = last["acked_total"] - first["acked_total"]
+    stored = summary.get("HL7Message_rows_added")
+    if stored is not None and acked > 0 and stored < acked * 0.95:
+        summary["flags"].append(f"Stored HL7Message rows ({stored}) lag acknowledged messages ({acked})")
+    return summary
+
+
+def simulate_soak_test(duration_hours=4.0, rate=1.0, sample_interval=60, target_pid=None,
+                       warmup_s=300, host=None, port=None):
+    """Hold a steady message rate against the HL7 listener for hours while sampling
+    the listener process and database growth; writes a CSV time series and JSON report"""
+    for name, value in (("duration_hours", duration_hours), ("rate", rate), ("sample_interval", sample_interval)):
+        if not math.isfinite(value) or value <= 0:
+            print(f"[SOAK] {name} must be a finite number greater than 0 (got {value})")
+            return None
+    if host is None:
+        host = AUTOMATE_CONFIG['config']['ipAddress']
+    if port is None:
+        port = AUTOMATE_CONFIG['config']['port']
+    if target_pid is None:
+        target_pid = _find_pid_listening_on(port)
+    if target_pid:
+        print(f"[SOAK] Sampling listener process PID {target_pid} from /proc")
+    else:
+        print(f"[SOAK] No local process found listening on port {port}; process metrics disabled")
+    if not _DB.available:
+        print("[SOAK] Database not available; table growth will not be sampled")
+    else:
+        # Make sure the listener can resolve the automate so it writes transfer logs
+        _DB.get_or_create_automate(AUTOMATE_CONFIG)
+
+    report_dir = Path(__file__).resolve().parents[1] / "logs" / "soak"
+    report_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    csv_path = report_dir / f"soak-{stamp}.csv"
+    json_path = report_dir / f"soak-{stamp}.json"
+
+    sampler = ProcSampler(target_pid, port)
+    sampler.sample()  # prime the CPU counters
+    hl7 = HL7Message()
+    samples = []
+    sock = None
+    ever_connected = False
+    seq = 0
+    acked_total = errors_total = reconnects = 0
+    window_latencies = []
+    window_acked = window_errors = 0
+
+    start = time.time()
+    end_at = start + duration_hours * 3600.0
+    next_send = start
+    next_sample = start + sample_interval
+    window_start = start
+
+    print(f"[SOAK] Running {duration_hours}h at {rate} msg/s against {host}:{port}, sampling every {sample_interval}s")
+    print(f"[SOAK] Time series: {csv_path}")
+    try:
+        with open(csv_path, "w", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=SOAK_COLUMNS, restval="")
+            writer.writeheader()
+            while time.time() < end_at:
+                now = time.time()
+                if now >= next_send:
+                    next_send += 1.0 / rate
+                    seq += 1
+                    try:
+                        if sock is None:
+                            sock = socket.create_connection((host, port), timeout=5)
+                            if ever_connected:
+                                reconnects += 1
+                            ever_connected = True
+                        t0 = time.time()
+                        _send_soak_message(sock, hl7, seq)
+                        window_latencies.append((time.time() - t0) * 1000.0)
+                        window_acked += 1
+                        acked_total += 1
+                    except Exception as e:
+                        window_errors += 1
+                        errors_total += 1
+                        if errors_total <= 10 or errors_total % 100 == 0:
+                            print(f"[SOAK] Send #{seq} failed: {e}")
+                        try:
+                            if sock:
+                                sock.close()
+                        except Exception:
+                            pass
+                        sock = None
+                    # Don't try to catch up with a backlog after a stall; keep the rate steady
+                    if next_send < time.time() - 1.0:
+                        next_send = time.time()
+
+                now = time.time()
+                if now >= next_sample:
+                    elapsed_window = now - window_start
+                    row = {
+                        "timestamp": datetime.now().isoformat(timespec="seconds"),
+                        "elapsed_s": round(now - start, 1),
+                        "sent_total": seq,
+                        "acked_total": acked_total,
+                        "errors_total": errors_total,
+                        "reconnects": reconnects,
+                        "throughput_msg_s": round(window_acked / elapsed_window, 3) if elapsed_window > 0 else None,
+                        "error_count": window_errors,
+                        "latency_p50_ms": _percentile(window_latencies, 50),
+                        "latency_p95_ms": _percentile(window_latencies, 95),
+                        "latency_max_ms": max(window_latencies) if window_latencies else None,
+                    }
+                    for key in ("latency_p50_ms", "latency_p95_ms", "latency_max_ms"):
+                        if row[key] is not None:
+                            row[key] = round(row[key], 2)
+                    row.update(sampler.sample())
+                    row.update(_db_table_stats())
+                    samples.append(row)
+
+                    writer.writerow(row)
+                    csv_file.flush()
+
+                    print(f"[SOAK] t={row['elapsed_s']:.0f}s acked={acked_total} err={errors_total} "
+                          f"tput={row['throughput_msg_s']} msg/s p95={row['latency_p95_ms']} ms "
+                          f"rss={row.get('rss_mb')} MB fds={row.get('open_fds')} cpu={row.get('cpu_pct')}% "
+                          f"hl7msg={row.get('HL7Message_rows')}")
+
+                    window_latencies = []
+                    window_acked = window_errors = 0
+                    window_start = now
+                    next_sample += sample_interval
+
+                time.sleep(max(0.0, min(next_send, next_sample, end_at) - time.time()))
+    except KeyboardInterrupt:
+        print("\n[SOAK] Stopped by user; writing report for samples collected so far")
+    finally:
+        try:
+            if sock:
+                sock.close()
+        except Exception:
+            pass
+
+    if len(samples) < 2:
+        print("[SOAK] Not enough samples for a report")
+        return None
+
+    summary = analyze_soak_samples(samples, warmup_s=warmup_s)
+    report = {
+        "target": f"{host}:{port}",
+        "pid": sampler.pid,
+        "rate_msg_s": rate,
+        "sample_interval_s": sample_interval,
+        "started_at": datetime.fromtimestamp(start).isoformat(timespec="seconds"),
+        "duration_s": samples[-1]["elapsed_s"],
+        "summary": summary,
+        "samples": samples,
+    }
+    json_path.write_text(json.dumps(report, indent=2))
+
+    print("\n===== SOAK TEST REPORT =====")
+    for key, value in summary.items():
+        if key not in ("flags", "notes"):
+            print(f"{key}: {value}")
+    if summary["notes"]:
+        print("\nNOTES:")
+        for note in summary["notes"]:
+            print(f"- {note}")
+    if summary["flags"]:
+        print("\nFLAGS:")
+        for flag in summary["flags"]:
+            print(f"- {flag}")
+    elif summary["notes"]:
+        print("\nNo flags raised (see notes for skipped checks)")
+    else:
+        print("\nNo leaks or drift detected")
+    print(f"\nReport written to {json_path}")
+    print("============================\n")
+    return report
+
 if __name__ == "__main__":
     print("""
 ╔══════════════════════════════════════════════╗
@@ -608,9 +1031,10 @@ if __name__ == "__main__":
         print("1. Send single message")
         print("2. Start continuous simulation")
         print("3. Create NEW request for NEW test patient and random test + result")
-        print("4. Exit")
+        print("4. Start soak test (long-running, tracks leaks and drift)")
+        print("5. Exit")
         
-        choice = input("\nSelect an option (1-4): ")
+        choice = input("\nSelect an option (1-5): ")
         
         if choice == "1":
             send_hl7_message()
@@ -625,6 +1049,20 @@ if __name__ == "__main__":
         elif choice == "3":
             create_random_request_and_result()
         elif choice == "4":
+            try:
+                hours = input("Duration in hours (default 4): ")
+                rate = input("Messages per second (default 1): ")
+                sample_interval = input("Sampling interval in seconds (default 60): ")
+                pid = input("Listener PID (default: auto-detect from port): ")
+                hours = float(hours) if hours else 4.0
+                rate = float(rate) if rate else 1.0
+                sample_interval = int(sample_interval) if sample_interval else 60
+                pid = int(pid) if pid else None
+            except ValueError:
+                print("Invalid value. Please enter numbers only.")
+                continue
+            simulate_soak_test(duration_hours=hours, rate=rate, sample_interval=sample_interval, target_pid=pid)
+        elif choice == "5":
             print("Exiting simulator...")
             break
         else: